@@ -0,0 +1,178 @@
+/*
+ * Fixed-length TD(lambda) update kernels, exposed to Python via pybind11.
+ *
+ * When the number of features is known ahead of time, making it a template
+ * parameter lets the compiler fully unroll and vectorize the loops (with FMA
+ * instructions where the target supports them), since there is no runtime
+ * loop bound or remainder to deal with.
+ * The update is the same as `td_update` in `py3/_td_kernels.py`; `TD` in
+ * `py3/td.py` uses the specialized version when constructed with
+ * `specialized=True`, if the extension is importable and provides a kernel
+ * for its number of features.
+ * In practice pybind11's argument conversion (and, for double precision,
+ * first trying the single precision overload) costs more than the unrolling
+ * saves, so this is slower than the Numba kernel for the lengths below.
+ *
+ * Compile with (from the root of the repository):
+ *
+ *   c++ -O3 -march=native -fopenmp-simd -shared -std=c++11 -fPIC \
+ *       $(python3 -m pybind11 --includes) cpp/td_kernel.cpp \
+ *       -o py3/td_kernel$(python3-config --extension-suffix)
+ *
+ * To specialize for other lengths, add them to the module definition below.
+ */
+#include <stdexcept>
+#include <string>
+
+#if defined(__AVX2__) && defined(__FMA__)
+#include <immintrin.h>
+#define TD_KERNEL_AVX2
+#endif
+
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+
+namespace py = pybind11;
+
+// dense, C-contiguous array of single or double precision values
+template<typename T>
+using vector = py::array_t<T, py::array::c_style>;
+
+
+// Inner product of `w` with `g*xp - x`, accumulated in double precision.
+template<typename T, int N>
+double dot_diff(const T *w, const T *x, const T *xp, T g)
+{
+    double dot_d = 0;
+    #pragma omp simd reduction(+:dot_d)
+    for (int i=0; i<N; i++) {
+        dot_d += w[i]*(g*xp[i] - x[i]);
+    }
+    return dot_d;
+}
+
+
+#ifdef TD_KERNEL_AVX2
+// Sum of the four entries of `v`.
+inline double hsum(__m256d v)
+{
+    __m128d lo = _mm256_castpd256_pd128(v);
+    __m128d hi = _mm256_extractf128_pd(v, 1);
+    lo = _mm_add_pd(lo, hi);
+    return _mm_cvtsd_f64(_mm_add_sd(lo, _mm_unpackhi_pd(lo, lo)));
+}
+
+
+// With AVX2, the inner product is split across four independent accumulators,
+// so that each FMA does not have to wait for the result of the previous one.
+template<int N>
+double dot_diff_avx2(const double *w, const double *x, const double *xp, double g)
+{
+    static_assert(N % 16 == 0, "the number of features must be a multiple of 16");
+    __m256d gv = _mm256_set1_pd(g);
+    __m256d acc[4] = {_mm256_setzero_pd(), _mm256_setzero_pd(),
+                      _mm256_setzero_pd(), _mm256_setzero_pd()};
+    for (int i=0; i<N; i+=16) {
+        for (int k=0; k<4; k++) {
+            __m256d xk = _mm256_loadu_pd(x + i + 4*k);
+            __m256d dk = _mm256_fmsub_pd(gv, _mm256_loadu_pd(xp + i + 4*k), xk);
+            acc[k] = _mm256_fmadd_pd(_mm256_loadu_pd(w + i + 4*k), dk, acc[k]);
+        }
+    }
+    return hsum(_mm256_add_pd(_mm256_add_pd(acc[0], acc[1]),
+                              _mm256_add_pd(acc[2], acc[3])));
+}
+
+
+// For single precision, `w*(g*xp - x)` is computed eight entries at a time,
+// and then widened (four at a time) into the double precision accumulators.
+template<int N>
+double dot_diff_avx2(const float *w, const float *x, const float *xp, float g)
+{
+    static_assert(N % 16 == 0, "the number of features must be a multiple of 16");
+    __m256 gv = _mm256_set1_ps(g);
+    __m256d acc[4] = {_mm256_setzero_pd(), _mm256_setzero_pd(),
+                      _mm256_setzero_pd(), _mm256_setzero_pd()};
+    for (int i=0; i<N; i+=16) {
+        for (int k=0; k<2; k++) {
+            __m256 xk = _mm256_loadu_ps(x + i + 8*k);
+            __m256 dk = _mm256_fmsub_ps(gv, _mm256_loadu_ps(xp + i + 8*k), xk);
+            __m256 pk = _mm256_mul_ps(_mm256_loadu_ps(w + i + 8*k), dk);
+            acc[2*k] = _mm256_add_pd(acc[2*k], _mm256_cvtps_pd(_mm256_castps256_ps128(pk)));
+            acc[2*k+1] = _mm256_add_pd(acc[2*k+1], _mm256_cvtps_pd(_mm256_extractf128_ps(pk, 1)));
+        }
+    }
+    return hsum(_mm256_add_pd(_mm256_add_pd(acc[0], acc[1]),
+                              _mm256_add_pd(acc[2], acc[3])));
+}
+#endif
+
+
+template<typename T, int N>
+double td_update(T *w, T *z, const T *x, const T *xp,
+                 double r, double alpha, double gm, double gm_p, double lm)
+{
+    // `delta = r + gm_p*w^T xp - w^T x`, as a single inner product
+#ifdef TD_KERNEL_AVX2
+    double delta = r + dot_diff_avx2<N>(w, x, xp, (T) gm_p);
+#else
+    double delta = r + dot_diff<T, N>(w, x, xp, (T) gm_p);
+#endif
+
+    T gl = gm*lm;
+    T az = alpha*delta;
+    #pragma omp simd
+    for (int i=0; i<N; i++) {
+        z[i] = x[i] + gl*z[i];
+        w[i] += az*z[i];
+    }
+    return delta;
+}
+
+
+template<typename T>
+void check_length(const vector<T> &v, const char *name, int n)
+{
+    if (v.ndim() != 1 || v.shape(0) != n) {
+        throw std::invalid_argument(
+            std::string(name) + " must be a 1D array of length " + std::to_string(n));
+    }
+}
+
+
+template<typename T, int N>
+double py_td_update(vector<T> w, vector<T> z, vector<T> x, vector<T> xp,
+                    double r, double alpha, double gm, double gm_p, double lm)
+{
+    check_length(w, "w", N);
+    check_length(z, "z", N);
+    check_length(x, "x", N);
+    check_length(xp, "xp", N);
+    return td_update<T, N>(w.mutable_data(), z.mutable_data(),
+                           x.data(), xp.data(), r, alpha, gm, gm_p, lm);
+}
+
+
+template<typename T, int N>
+void def_td_update(py::module &m)
+{
+    // `w` and `z` are updated in-place, so they must not be converted (which
+    // would silently update a copy instead); this also means that the overload
+    // is chosen according to the type of the weights
+    std::string name = "td_update_" + std::to_string(N);
+    m.def(name.c_str(), &py_td_update<T, N>,
+          py::arg("w").noconvert(), py::arg("z").noconvert(),
+          py::arg("x"), py::arg("xp"),
+          py::arg("r"), py::arg("alpha"), py::arg("gm"), py::arg("gm_p"),
+          py::arg("lm"),
+          "TD(lambda) update for a fixed number of features.");
+}
+
+
+PYBIND11_MODULE(td_kernel, m) {
+    m.doc() = "Fixed-length TD(lambda) update kernels.";
+    def_td_update<float, 2048>(m);
+    def_td_update<double, 2048>(m);
+    def_td_update<float, 4096>(m);
+    def_td_update<double, 4096>(m);
+}
@@ -0,0 +1,65 @@
+"""
+Checking (and converting) the features passed to the learning algorithms.
+
+The compiled kernels in `_td_kernels.py` do not check array bounds, so the
+classes use these to check their arguments before calling a kernel; otherwise
+an index or feature vector of the wrong size would silently read (or write)
+past the end of an array instead of raising an exception.
+"""
+import numpy as np
+
+
+def as_indices(idx, n, name='idx'):
+    """Convert `idx` to an array of indices, checking that each is in `[0, n)`.
+
+    Raises an `IndexError` if any of the indices are out of range.
+    """
+    idx = np.asarray(idx, dtype=np.intp)
+    if idx.size and (idx.min() < 0 or idx.max() >= n):
+        raise IndexError("%s must only contain indices in [0, %d)" % (name, n))
+    return idx
+
+
+def check_features(n, *features):
+    """Check that each of `features` is an array with shape `(n,)`.
+
+    Raises a `ValueError` otherwise; in particular, features of the wrong
+    length are never broadcast.
+    """
+    for x in features:
+        if x.shape != (n,):
+            raise ValueError("expected features with shape (%d,), got %s" % (n, x.shape))
+
+
+def as_features(x, xp, out):
+    """Convert `x` and `xp` to arrays of the same type as `out`.
+
+    `out` is an array with shape `(2, n)`; features that are not already of
+    its type are copied into its rows, rather than into newly allocated arrays,
+    so the results are only valid until the next call with the same `out`.
+    The shapes of the features are checked (as in `check_features`) before
+    anything is copied, so they are never broadcast into `out`.
+    """
+    x = np.asarray(x)
+    xp = np.asarray(xp)
+    check_features(out.shape[1], x, xp)
+    if x.dtype != out.dtype:
+        out[0] = x
+        x = out[0]
+    if xp.dtype != out.dtype:
+        out[1] = xp
+        xp = out[1]
+    return x, xp
+
+
+def check_trajectory(n, X, R, Xp):
+    """Check the shapes of a sequence of transitions.
+
+    `R` must have shape `(T,)`, and `X` and `Xp` must both have shape `(T, n)`;
+    raises a `ValueError` otherwise.
+    """
+    T = len(R)
+    if R.shape != (T,) or X.shape != (T, n) or Xp.shape != (T, n):
+        raise ValueError("expected rewards with shape (T,) and features with "
+                         "shape (T, %d), got %s, %s and %s"
+                         % (n, R.shape, X.shape, Xp.shape))
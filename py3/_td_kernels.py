@@ -0,0 +1,455 @@
+"""
+Compiled kernels for the linear-time TD-style learning algorithms.
+
+The classes in the neighbouring modules describe the algorithms with the usual
+vector equations; the functions here compute the same updates, but do so in a
+couple of explicit loops over the features, which Numba[0] compiles to native
+code.
+
+Written with NumPy, a single TD(λ) step involves two dot products, a scaled
+trace update and an AXPY on the weights, each of which walks the length-`n`
+arrays on its own (and most of which allocate a temporary array).
+Here, the first loop computes the inner products needed for the TD-error, and
+the second loop updates the traces and the weights in-place, so each array is
+only read (or written) once or twice per step.
+
+All of the kernels modify their array arguments in-place and return the TD-error.
+They work with either single or double precision arrays; inner products are
+accumulated in double precision, while the scalars used in the elementwise
+updates are cast to the type of the weights, so that single precision updates
+are not silently promoted to double precision.
+The learners default to single precision, which is usually plenty for
+approximating a value function, and halves the memory traffic of each update.
+
+
+References
+----------
+
+0: https://numba.pydata.org/
+"""
+import math
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def td_update(w, z, x, xp, r, alpha, gm, gm_p, lm):
+    """TD(λ) with accumulating traces, see `td.TD.update`."""
+    n = w.shape[0]
+    # `delta = r + gm_p*w^T xp - w^T x`, as a single inner product
+    g = w.dtype.type(gm_p)
+    dot_d = 0.0
+    for i in range(n):
+        dot_d += w[i]*(g*xp[i] - x[i])
+    delta = r + dot_d
+
+    gl = w.dtype.type(gm*lm)
+    az = w.dtype.type(alpha*delta)
+    for i in range(n):
+        z[i] = x[i] + gl*z[i]
+        w[i] += az*z[i]
+    return delta
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def td0_update(w, x, xp, r, alpha, gm_p):
+    """TD(0), see `td.TD` with `td0=True`.
+
+    With λ=0 the trace is just the current features, so it is not stored at
+    all, and the weight update uses `x` directly.
+    """
+    n = w.shape[0]
+    g = w.dtype.type(gm_p)
+    dot_d = 0.0
+    for i in range(n):
+        dot_d += w[i]*(g*xp[i] - x[i])
+    delta = r + dot_d
+
+    ad = w.dtype.type(alpha*delta)
+    for i in range(n):
+        w[i] += ad*x[i]
+    return delta
+
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache=True)
+def td_update_parallel(w, z, x, xp, r, alpha, gm, gm_p, lm):
+    """TD(λ) with accumulating traces, with the loops spread across threads.
+
+    This is the same as `td_update`, but each loop is split into chunks that
+    are handled by separate threads (the dot products by a parallel reduction),
+    so that a single update can use the memory bandwidth of several cores.
+    Starting the threads costs a few microseconds per loop, so this is only
+    worthwhile for very long feature vectors.
+    """
+    n = w.shape[0]
+    g = w.dtype.type(gm_p)
+    dot_d = 0.0
+    for i in prange(n):
+        dot_d += w[i]*(g*xp[i] - x[i])
+    delta = r + dot_d
+
+    gl = w.dtype.type(gm*lm)
+    az = w.dtype.type(alpha*delta)
+    for i in prange(n):
+        z[i] = x[i] + gl*z[i]
+        w[i] += az*z[i]
+    return delta
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def totd_update(w, w_old, z, x, xp, r, alpha, gm, gm_p, lm):
+    """True-online TD(λ), see `totd.TOTD.update`.
+
+    The four inner products are computed in the first pass; the second pass
+    updates the dutch trace and the weights, saving the weights from before the
+    update into `w_old` for the next timestep.
+    """
+    n = w.shape[0]
+    dot_x = 0.0
+    dot_xp = 0.0
+    dot_old_x = 0.0
+    dot_zx = 0.0
+    for i in range(n):
+        dot_x += w[i]*x[i]
+        dot_xp += w[i]*xp[i]
+        dot_old_x += w_old[i]*x[i]
+        dot_zx += z[i]*x[i]
+    # the TD-error bootstraps from the previous weights' value of `x`
+    delta = r + gm_p*dot_xp - dot_old_x
+
+    # `z = gm*lm*z + alpha*x - alpha*gm*lm*(z^T x)*x`
+    # `w += delta*z + alpha*(w_old^T x - w^T x)*x`
+    gl = w.dtype.type(gm*lm)
+    zc = w.dtype.type(alpha*(1 - gm*lm*dot_zx))
+    wc = w.dtype.type(alpha*(dot_old_x - dot_x))
+    d = w.dtype.type(delta)
+    for i in range(n):
+        z[i] = gl*z[i] + zc*x[i]
+        w_old[i] = w[i]
+        w[i] += d*z[i] + wc*x[i]
+    return delta
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def td_trajectory(w, z, X, R, Xp, alpha, gm, gm_p, lm):
+    """TD(λ) over a sequence of transitions, see `td.TD.update_trajectory`.
+
+    Row `t` of `X` and `Xp` holds the features of the `t`-th transition; the
+    other arguments are arrays with one entry per transition.
+    """
+    T = R.shape[0]
+    deltas = np.empty(T)
+    for t in range(T):
+        deltas[t] = td_update(w, z, X[t], Xp[t], R[t],
+                              alpha[t], gm[t], gm_p[t], lm[t])
+    return deltas
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def totd_trajectory(w, w_old, z, X, R, Xp, alpha, gm, gm_p, lm):
+    """True-online TD(λ) over a sequence of transitions, see
+    `totd.TOTD.update_trajectory`.
+
+    The arguments are laid out as for `td_trajectory`.
+    """
+    T = R.shape[0]
+    deltas = np.empty(T)
+    for t in range(T):
+        deltas[t] = totd_update(w, w_old, z, X[t], Xp[t], R[t],
+                                alpha[t], gm[t], gm_p[t], lm[t])
+    return deltas
+
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache=True)
+def batch_td_update(W, Z, n, x, xp, r, alpha, gm, gm_p, lm):
+    """Independent TD(λ) learners updated in parallel, see
+    `batch_td.BatchTD.update_parallel`.
+
+    Row `l` of `W` and `Z` holds the weights and trace of learner `l` in its
+    first `n` entries (the rest is padding); the other arguments are arrays
+    with one entry per learner.
+    Each learner only writes to its own rows, so they can be updated by
+    separate threads without any synchronization.
+    """
+    L = W.shape[0]
+    deltas = np.empty(L)
+    for l in prange(L):
+        deltas[l] = td_update(W[l, :n], Z[l, :n], x, xp, r[l],
+                              alpha[l], gm[l], gm_p[l], lm[l])
+    return deltas
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def etd_update(w, z, x, xp, r, alpha, gm, gm_p, lm, rho, M):
+    """ETD(λ), see `etd.ETD.update`.
+
+    The followon trace and emphasis are scalars, so they are computed by the
+    caller and the emphasis `M` for the current timestep is passed in.
+    """
+    n = w.shape[0]
+    g = w.dtype.type(gm_p)
+    dot_d = 0.0
+    for i in range(n):
+        dot_d += w[i]*(g*xp[i] - x[i])
+    delta = r + dot_d
+
+    rgl = w.dtype.type(rho*gm*lm)
+    rM = w.dtype.type(rho*M)
+    az = w.dtype.type(alpha*delta)
+    for i in range(n):
+        z[i] = rM*x[i] + rgl*z[i]
+        w[i] += az*z[i]
+    return delta
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def dvtd_update(w, z, w_var, x, xp, r, alpha, gm, gm_p, lm, lm_p):
+    """DVTD(λ), see `dvtd.DVTD.update`.
+
+    The value and variance estimators share the same features, so both are
+    updated in the same pair of passes; returns both TD-errors.
+    """
+    n = w.shape[0]
+    dot_x = 0.0
+    dot_xp = 0.0
+    dot_var_x = 0.0
+    dot_var_xp = 0.0
+    for i in range(n):
+        dot_x += w[i]*x[i]
+        dot_xp += w[i]*xp[i]
+        dot_var_x += w_var[i]*x[i]
+        dot_var_xp += w_var[i]*xp[i]
+    delta = r + gm_p*dot_xp - dot_x
+
+    r_var = delta*delta
+    gm_var = (gm_p*lm_p)**2
+    delta_var = r_var + gm_var*dot_var_xp - dot_var_x
+
+    gl = w.dtype.type(gm*lm)
+    az = w.dtype.type(alpha*delta)
+    a_var = w.dtype.type(alpha*delta_var)
+    for i in range(n):
+        z[i] = x[i] + gl*z[i]
+        w[i] += az*z[i]
+        w_var[i] += a_var*x[i]
+    return delta, delta_var
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def gtd_update(w, e, h, x, xp, r, alpha, beta, gm, gm_p, lm, lm_p, rho):
+    """GTD(λ), see `gtd.GTD.update`.
+
+    The correction term for `w` depends on `e^T h` after the trace has been
+    updated, so this takes three passes instead of two.
+    """
+    n = w.shape[0]
+    g = w.dtype.type(gm_p)
+    dot_d = 0.0
+    dot_hx = 0.0
+    for i in range(n):
+        dot_d += w[i]*(g*xp[i] - x[i])
+        dot_hx += h[i]*x[i]
+    delta = r + dot_d
+
+    rgl = w.dtype.type(rho*gm*lm)
+    rho = w.dtype.type(rho)
+    dot_eh = 0.0
+    for i in range(n):
+        e[i] = rgl*e[i] + rho*x[i]
+        dot_eh += e[i]*h[i]
+
+    # `w += alpha*(delta*e - gm_p*(1-lm_p)*(e^T h)*xp)`
+    # `h += beta*(delta*e - (h^T x)*x)`
+    ad = w.dtype.type(alpha*delta)
+    ac = w.dtype.type(alpha*gm_p*(1 - lm_p)*dot_eh)
+    bd = w.dtype.type(beta*delta)
+    bh = w.dtype.type(beta*dot_hx)
+    for i in range(n):
+        w[i] += ad*e[i] - ac*xp[i]
+        h[i] += bd*e[i] - bh*x[i]
+    return delta
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def htd_update(w, e, z, h, x, xp, r, alpha, beta, gm, gm_p, lm, rho):
+    """HTD(λ), see `htd.HTD.update`.
+
+    As with GTD(λ), the correction terms depend on the updated traces, so this
+    takes three passes instead of two.
+    """
+    n = w.shape[0]
+    g = w.dtype.type(gm_p)
+    dot_d = 0.0
+    for i in range(n):
+        dot_d += w[i]*(g*xp[i] - x[i])
+    delta = r + dot_d
+
+    rgl = w.dtype.type(rho*gm*lm)
+    gl = w.dtype.type(gm*lm)
+    rho = w.dtype.type(rho)
+    dot_zeh = 0.0
+    dot_zh = 0.0
+    for i in range(n):
+        e[i] = rgl*e[i] + rho*x[i]
+        z[i] = gl*z[i] + x[i]
+        dot_zeh += (z[i] - e[i])*h[i]
+        dot_zh += z[i]*h[i]
+
+    # `w += alpha*(delta*e + (gm_p*xp - x)*((z - e)^T h))`
+    # `h += beta*(delta*e + (gm_p*xp - x)*(z^T h))`
+    ad = w.dtype.type(alpha*delta)
+    ac = w.dtype.type(alpha*dot_zeh)
+    bd = w.dtype.type(beta*delta)
+    bc = w.dtype.type(beta*dot_zh)
+    gm_p = w.dtype.type(gm_p)
+    for i in range(n):
+        diff = gm_p*xp[i] - x[i]
+        w[i] += ad*e[i] + ac*diff
+        h[i] += bd*e[i] + bc*diff
+    return delta
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def td_update_sparse(w, z, z_scale, idx, idx_p, r, alpha, gm, gm_p, lm):
+    """TD(λ) for binary features given by their active indices, see
+    `td.TD.update_sparse`.
+
+    The trace is stored as `z_scale * z`, so decaying it only changes the
+    scalar `z_scale`, and adding the current features only touches the `k`
+    active entries of `z`; the inner products are likewise over the active
+    features only.
+    The weight update is still a single pass over all `n` features, since
+    every nonzero entry of the trace contributes to it.
+
+    Returns the TD-error and the new value of `z_scale`.
+    """
+    n = w.shape[0]
+    dot_x = 0.0
+    for i in idx:
+        dot_x += w[i]
+    dot_xp = 0.0
+    for i in idx_p:
+        dot_xp += w[i]
+    delta = r + gm_p*dot_xp - dot_x
+
+    # `z = gm*lm*z + x`, decaying the trace via its scale factor
+    z_scale *= gm*lm
+    if z_scale < 1e-16:
+        # fold the scale back into `z` before `1/z_scale` gets out of hand
+        s = w.dtype.type(z_scale)
+        for i in range(n):
+            z[i] *= s
+        z_scale = 1.0
+    inc = w.dtype.type(1.0/z_scale)
+    for i in idx:
+        z[i] += inc
+
+    # `w += alpha*delta*z`, with `z` scaled by `z_scale`
+    az = w.dtype.type(alpha*delta*z_scale)
+    for i in range(n):
+        w[i] += az*z[i]
+    return delta, z_scale
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def sparse_td_update(w, z_idx, z_val, pos, nnz, idx, idx_p, r,
+                     alpha, gm, gm_p, lm, tol):
+    """TD(λ) with a sparse trace, for binary features given by their active
+    indices, see `sparse_td.SparseTD.update`.
+
+    The trace is stored as the first `nnz` entries of `z_idx` (the indices) and
+    `z_val` (the values), with `pos[i]` the position of feature `i` in those
+    arrays, or -1 if it is not in the trace.
+    Entries whose magnitude falls below `tol` are removed from the trace in the
+    same pass as the weight update, so every step costs time proportional to
+    the number of entries in the trace and active features, rather than `n`.
+
+    Returns the TD-error and the new number of entries in the trace.
+    """
+    dot_x = 0.0
+    for i in idx:
+        dot_x += w[i]
+    dot_xp = 0.0
+    for i in idx_p:
+        dot_xp += w[i]
+    delta = r + gm_p*dot_xp - dot_x
+
+    # `z = gm*lm*z + x`, adding newly active features to the end of the trace
+    gl = w.dtype.type(gm*lm)
+    for j in range(nnz):
+        z_val[j] *= gl
+    for i in idx:
+        j = pos[i]
+        if j < 0:
+            j = nnz
+            pos[i] = j
+            z_idx[j] = i
+            z_val[j] = 0
+            nnz += 1
+        z_val[j] += 1
+
+    # `w += alpha*delta*z`, while compacting the trace to drop small entries
+    az = w.dtype.type(alpha*delta)
+    k = 0
+    for j in range(nnz):
+        i = z_idx[j]
+        v = z_val[j]
+        w[i] += az*v
+        if abs(v) >= tol:
+            z_idx[k] = i
+            z_val[k] = v
+            pos[i] = k
+            k += 1
+        else:
+            pos[i] = -1
+    return delta, k
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def idbd_update(beta, alpha, w, h, x, delta, eta):
+    """Incremental Delta-Bar-Delta, see `idbd.IDBD.update`.
+
+    Unlike the other kernels, the error `delta` is computed by the caller, so
+    this needs only a single pass over the features.
+    """
+    n = w.shape[0]
+    for i in range(n):
+        beta[i] += eta*delta*x[i]*h[i]
+        alpha[i] = math.exp(beta[i])
+        adx = alpha[i]*delta*x[i]
+        w[i] += adx
+        decay = 1 - alpha[i]*x[i]*x[i]
+        if decay < 0:
+            decay = 0
+        h[i] = h[i]*decay + adx
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def quantize(w, w_q):
+    """Quantize `w` to 8-bit integers in `w_q`, returning the scale factor.
+
+    The scale is chosen so that `scale*w_q` approximates `w`, with the largest
+    entry (in absolute value) mapped to ±127.
+    """
+    n = w.shape[0]
+    w_max = 0.0
+    for i in range(n):
+        w_max = max(w_max, abs(w[i]))
+    if w_max == 0.0:
+        w_q[:] = 0
+        return 0.0
+    scale = w_max/127
+    for i in range(n):
+        w_q[i] = round(w[i]/scale)
+    return scale
+
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def quantized_dot(w_q, scale, x):
+    """Approximate `np.dot(w, x)` using the quantized weights from `quantize`."""
+    n = w_q.shape[0]
+    acc = 0.0
+    for i in range(n):
+        acc += w_q[i]*x[i]
+    return scale*acc
@@ -0,0 +1,88 @@
+"""
+A "bank" of learning algorithms whose weights and traces share memory.
+
+
+Summary
+-------
+
+When comparing algorithms (say TD(λ), GTD(λ), and ETD(λ)) on the same data, it
+is natural to create one instance of each and update all of them from every
+transition.
+Normally each instance allocates its own weight vector and trace somewhere on
+the heap; here, the weight vectors of all the algorithms are instead the rows
+of a single `(K, n)` matrix (and likewise for the traces), so a step that
+updates every algorithm walks through one contiguous block of memory.
+It also means the weights of all the algorithms can be inspected (or saved)
+at once, without having to collect them from each instance.
+
+For the best results, convert the features to the algorithms' `dtype` once,
+and pass the same arrays to each algorithm's `update`, so that they are not
+converted again by every algorithm.
+"""
+import numpy as np
+
+
+def make_algo_bank(n, classes, dtype=np.float32):
+    """Create an instance of each of `classes`, with shared weights and traces.
+
+    Parameters
+    ----------
+    n : int
+        The number of features, i.e. expected length of the feature vector.
+    classes : Sequence[type]
+        The learning algorithms to instantiate, e.g. `[TD, GTD, ETD]`.
+        Each is called as `cls(n, dtype=dtype)`.
+        The supported learners are `TD`, `TOTD`, `ETD`, `GTD`, `HTD`, and
+        `IDBD` (which has no trace, so its row of `Z` stays zero); others,
+        like `SparseTD` (whose trace is not a dense vector) or `LSTD`, raise a
+        `ValueError`.
+    dtype : data-type, optional
+        The floating point type of the weights and traces.
+
+    Returns
+    -------
+    algos : list
+        The instances, in the same order as `classes`.
+    W : Matrix[float]
+        The weights, with shape `(K, n)` where `K = len(classes)`; row `k` is
+        the weight vector (`w`) of `algos[k]`.
+    Z : Matrix[float]
+        The eligibility traces, with shape `(K, n)`; row `k` is the trace of
+        `algos[k]`, i.e., its `z` attribute (or `e`, for algorithms like GTD(λ)
+        whose only trace is called `e`).
+
+    Notes
+    -----
+    The instances' arrays are views into `W` and `Z`, and the algorithms update
+    (and reset) them in-place, so the rows of `W` always reflect the current
+    weights of each algorithm, and the rows of `Z` their traces.
+    The exception is `TD.update_sparse`, which decays the trace lazily via the
+    instance's `z_scale`, which the bank does not know about: after calling it
+    the trace of that algorithm is `algos[k].z_scale * Z[k]`, until the next
+    dense update (or `reset`) folds the scale back into `Z[k]`.
+    Other vectors, like GTD(λ)'s `h`, are not shared.
+    """
+    K = len(classes)
+    W = np.zeros((K, n), dtype=dtype)
+    Z = np.zeros((K, n), dtype=dtype)
+    algos = []
+    for k, cls in enumerate(classes):
+        try:
+            algo = cls(n, dtype=dtype)
+        except TypeError:
+            raise ValueError("%s cannot be created as `%s(n, dtype=dtype)`"
+                             % (cls.__name__, cls.__name__))
+        # the shared arrays replace the instance's own attributes, so anything
+        # else (like a property computed from other arrays) cannot be shared
+        attrs = vars(algo)
+        if 'w' not in attrs:
+            raise ValueError("%s has no weight vector `w` to share" % cls.__name__)
+        if hasattr(algo, 'z') and 'z' not in attrs:
+            raise ValueError("%s has no trace vector `z` to share" % cls.__name__)
+        algo.w = W[k]
+        if 'z' in attrs:
+            algo.z = Z[k]
+        elif 'e' in attrs:
+            algo.e = Z[k]
+        algos.append(algo)
+    return algos, W, Z
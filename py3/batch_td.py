@@ -0,0 +1,362 @@
+"""
+Batched TD(λ), for running many independent TD(λ) learners over the same
+stream of features.
+
+
+Summary
+-------
+
+It is common to run a number of TD(λ) learners side by side on the same
+experience, for example to sweep over step-sizes or bootstrapping parameters,
+or to learn several general value functions (GVFs) at once.
+Keeping a separate `TD` instance for each learner works, but then every step
+pays the Python overhead once per learner, and the feature vectors get read
+from memory once per learner as well.
+
+Instead, we store the weights and traces of all `L` learners as the rows of two
+`(L, n)` matrices.
+Computing the values of `x` and `xp` for every learner then takes a single
+matrix product (with `x` and `xp` as the two columns of the other matrix), and
+the trace and weight updates become broadcasted operations over the rows.
+Each learner may have its own step-size, discount, and bootstrapping parameter.
+
+For very large batches (or very long feature vectors) `BatchTDGPU` performs the
+same updates with the matrices stored on a GPU, via CuPy.
+
+
+Update Equations
+----------------
+
+The update equations are those of TD(λ) (see `td.py`), applied to each
+learner `l` separately:
+
+    δ_{t}^{l}   = R_{t+1} + γ_{t+1}^{l} w_{t}^{l T} x_{t+1} - w_{t}^{l T} x_{t}
+    e_{t}^{l}   = λ_{t}^{l} γ_{t}^{l} e_{t-1}^{l} + x_{t}
+    w_{t+1}^{l} = w_{t}^{l} + α^{l} δ_{t}^{l} e_{t}^{l}
+
+Stacking the weight vectors as the rows of `W` (and the traces as the rows of
+`Z`), the TD-errors for all learners are `R + γ' (W x') - W x`.
+"""
+import numpy as np
+
+from _features import check_features
+from _td_kernels import batch_td_update
+from td import TD
+
+
+def _column(v, dtype):
+    """Reshape a scalar or a length-`L` vector so it broadcasts over rows.
+
+    The result is cast to `dtype`, so that multiplying it with a single
+    precision matrix does not promote the result to double precision.
+    """
+    return np.reshape(np.asarray(v, dtype=dtype), (-1, 1))
+
+
+def _aligned_zeros(shape, dtype, align=64):
+    """Allocate an array of zeros whose data starts at a multiple of `align`
+    bytes, such as the start of a cache line.
+
+    NumPy only guarantees the alignment needed by the type of the elements, so
+    this over-allocates a byte buffer and views it from the first aligned byte.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape))*dtype.itemsize
+    buf = np.zeros(nbytes + align, dtype=np.uint8)
+    offset = -buf.ctypes.data % align
+    return buf[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+class BatchTD:
+    """A batch of independent TD(λ) learners sharing the same features.
+
+    Attributes
+    ----------
+    n : int
+        The number of features (and therefore the length of each weight vector).
+    L : int
+        The number of learners.
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
+    W : Matrix[float]
+        The weight matrix, with shape `(L, n)`; row `l` is the weight vector of
+        learner `l`.
+    Z : Matrix[float]
+        The eligibility trace matrix, with shape `(L, n)`.
+
+    Notes
+    -----
+    `W` and `Z` are views into arrays that are aligned to 64 bytes and whose
+    rows are padded to a multiple of 64 bytes, so they are not contiguous as a
+    whole (although each row is).
+    """
+    def __init__(self, n, L, dtype=np.float32):
+        """Initialize the learning algorithm.
+
+        Parameters
+        -----------
+        n : int
+            The number of features, i.e. expected length of the feature vector.
+        L : int
+            The number of learners.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
+        """
+        self.n = n
+        self.L = L
+        self.dtype = np.dtype(dtype)
+        # The weights and traces start at the beginning of a cache line, and
+        # their rows are padded to a whole number of cache lines (64 bytes), so
+        # each row occupies its own lines and threads updating different
+        # learners in `update_parallel` do not write to the same lines.
+        pad = -self.n % (64 // self.dtype.itemsize)
+        self._W = _aligned_zeros((self.L, self.n + pad), self.dtype)
+        self._Z = _aligned_zeros((self.L, self.n + pad), self.dtype)
+        self.W = self._W[:, :self.n]
+        self.Z = self._Z[:, :self.n]
+        # scratch space for the weight update, to avoid allocating every step
+        self._scratch = np.empty((self.L, self.n), dtype=self.dtype)
+        # `x` and `xp` are copied into the columns of this matrix, so that their
+        # values for every learner are computed in a single pass over `W`
+        self._xx = np.empty((self.n, 2), dtype=self.dtype, order='F')
+
+    def get_value(self, x):
+        """Get the approximate value of feature vector `x` for every learner."""
+        return np.dot(self.W, x)
+
+    def update(self, x, r, xp, alpha, gm, gm_p, lm):
+        """Update every learner from a transition `(x,r,xp)`.
+
+        Parameters
+        ----------
+        x : Vector[float]
+            The observation/features from the current timestep.
+        r : float or Vector[float]
+            The reward from the transition, or a vector with the reward
+            (cumulant) for each learner.
+        xp : Vector[float]
+            The observation/features from the next timestep.
+        alpha : float or Vector[float]
+            The step-size parameter(s) for updating the weights.
+        gm : float or Vector[float]
+            Gamma, abbreviated `gm`, the discount factor(s) for the current state.
+        gm_p : float or Vector[float]
+            The discount factor(s) for the next state.
+        lm : float or Vector[float]
+            Lambda, abbreviated `lm`, the bootstrapping parameter(s) for the
+            current timestep.
+
+        Returns
+        -------
+        deltas : Vector[float]
+            The temporal difference error of each learner, with shape `(L,)`.
+
+        Notes
+        -----
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
+        The other parameters may be scalars (shared by every learner) or arrays
+        of shape `(L,)`.
+        """
+        x = np.asarray(x)
+        xp = np.asarray(xp)
+        check_features(self.n, x, xp)
+        r, alpha, gm, gm_p, lm = (np.asarray(v, dtype=self.dtype)
+                                  for v in (r, alpha, gm, gm_p, lm))
+        self._xx[:, 0] = x
+        self._xx[:, 1] = xp
+        v = np.dot(self.W, self._xx)
+        deltas = r + gm_p*v[:, 1] - v[:, 0]
+        self.Z *= _column(gm*lm, self.dtype)
+        self.Z += self._xx[:, 0]
+        np.multiply(self.Z, _column(alpha*deltas, self.dtype), out=self._scratch)
+        self.W += self._scratch
+        return deltas
+
+    def update_parallel(self, x, r, xp, alpha, gm, gm_p, lm):
+        """Update every learner from a transition `(x,r,xp)`, in parallel.
+
+        This performs the same update as `update`, but each learner is
+        updated by a compiled kernel with the learners spread across threads,
+        which is faster when there are many learners and multiple cores.
+        See `update` for a description of the parameters.
+        """
+        x = np.asarray(x, dtype=self.dtype)
+        xp = np.asarray(xp, dtype=self.dtype)
+        check_features(self.n, x, xp)
+        r, alpha, gm, gm_p, lm = (np.broadcast_to(np.asarray(v, dtype=np.float64), (self.L,))
+                                  for v in (r, alpha, gm, gm_p, lm))
+        deltas = batch_td_update(self._W, self._Z, self.n, x, xp, r,
+                                 alpha, gm, gm_p, lm)
+        return deltas
+
+    def split(self):
+        """Get a list of `TD` instances, one per learner.
+
+        The weights and traces of each instance are views into the rows of
+        `self.W` and `self.Z`, so updating an instance updates the batch, and
+        vice versa.
+        Note that `TD.update_sparse` decays the trace lazily, via the
+        instance's `z_scale`, which the batch does not know about.
+        """
+        learners = []
+        for l in range(self.L):
+            td = TD(self.n, dtype=self.dtype)
+            td.w = self.W[l]
+            td.z = self.Z[l]
+            learners.append(td)
+        return learners
+
+    def reset(self):
+        """Reset weights, traces, and other parameters."""
+        # zero the arrays in-place so that views from `split()` remain valid
+        self.W.fill(0.0)
+        self.Z.fill(0.0)
+
+
+class BatchTDGPU:
+    """A batch of independent TD(λ) learners, stored and updated on a GPU.
+
+    This performs the same updates as `BatchTD`, but keeps the weights and
+    traces in GPU memory and updates them with CuPy[0].
+    Each step is a matrix product with an `(n, 2)` matrix followed by a couple
+    of elementwise operations over the `(L, n)` matrices, all of which are
+    limited by memory bandwidth, which is much higher on a GPU.
+    This pays off when `n` or `L` are large (e.g. `L*n` in the millions);
+    otherwise, the cost of launching the kernels and copying the features to
+    the device tends to dominate.
+
+    Attributes
+    ----------
+    n : int
+        The number of features (and therefore the length of each weight vector).
+    L : int
+        The number of learners.
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
+    W : Matrix[float]
+        The weight matrix (a device array), with shape `(L, n)`.
+    Z : Matrix[float]
+        The eligibility trace matrix (a device array), with shape `(L, n)`.
+    stream : cupy.cuda.Stream
+        The stream on which the updates are queued.
+
+    Notes
+    -----
+    The work for each update is queued on `self.stream` and `update` returns
+    without waiting for it to finish, so the host is free to (for example)
+    step the environment in the meantime; use `synchronize()` to wait for the
+    queued updates.
+    Copying features from host memory to the device is only asynchronous when
+    they are in pinned memory; passing device arrays avoids the copy entirely.
+
+    References
+    ----------
+    0: https://cupy.dev/
+    """
+    def __init__(self, n, L, dtype=np.float32, backend=None):
+        """Initialize the learning algorithm.
+
+        Parameters
+        -----------
+        n : int
+            The number of features, i.e. expected length of the feature vector.
+        L : int
+            The number of learners.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
+        backend : module, optional
+            The CuPy module (or a module with the same interface); imported on
+            demand if not provided.
+        """
+        if backend is None:
+            import cupy as backend
+        self.n = n
+        self.L = L
+        self.dtype = np.dtype(dtype)
+        self.backend = backend
+        self.W = backend.zeros((self.L, self.n), dtype=self.dtype)
+        self.Z = backend.zeros((self.L, self.n), dtype=self.dtype)
+        # scratch space for the weight update, to avoid allocating every step
+        self._scratch = backend.empty((self.L, self.n), dtype=self.dtype)
+        self._xx = backend.empty((self.n, 2), dtype=self.dtype, order='F')
+        self.stream = backend.cuda.Stream(non_blocking=True)
+
+    def _to_device(self, v):
+        """Copy `v` to the device (if necessary) as an array of `self.dtype`."""
+        return self.backend.asarray(v, dtype=self.dtype)
+
+    def _to_param(self, v):
+        """Copy a per-learner parameter to the device, if it is an array.
+
+        Scalars are returned as Python floats, which CuPy broadcasts without
+        copying them to the device (which, from pageable host memory, would
+        mean waiting for the copy to finish).
+        """
+        if np.ndim(v) == 0 and not isinstance(v, self.backend.ndarray):
+            return float(v)
+        return self._to_device(v)
+
+    def get_value(self, x):
+        """Get the approximate value of feature vector `x` for every learner."""
+        with self.stream:
+            return self.W @ self._to_device(x)
+
+    def update(self, x, r, xp, alpha, gm, gm_p, lm):
+        """Update every learner from a transition `(x,r,xp)`.
+
+        Parameters
+        ----------
+        x : Vector[float]
+            The observation/features from the current timestep.
+        r : float or Vector[float]
+            The reward from the transition, or a vector with the reward
+            (cumulant) for each learner.
+        xp : Vector[float]
+            The observation/features from the next timestep.
+        alpha : float or Vector[float]
+            The step-size parameter(s) for updating the weights.
+        gm : float or Vector[float]
+            Gamma, abbreviated `gm`, the discount factor(s) for the current state.
+        gm_p : float or Vector[float]
+            The discount factor(s) for the next state.
+        lm : float or Vector[float]
+            Lambda, abbreviated `lm`, the bootstrapping parameter(s) for the
+            current timestep.
+
+        Returns
+        -------
+        deltas : Vector[float]
+            The temporal difference error of each learner, as a device array
+            with shape `(L,)`; it is only valid once the update has finished.
+
+        Notes
+        -----
+        Parameters may be host or device arrays (or scalars); arrays are copied
+        to the device if necessary, while scalars are used as they are.
+        """
+        with self.stream:
+            # as in `BatchTD.update`, both values come from one pass over `W`
+            self._xx[:, 0] = self._to_device(x)
+            self._xx[:, 1] = self._to_device(xp)
+            r, alpha, gm, gm_p, lm = (self._to_param(v) for v in (r, alpha, gm, gm_p, lm))
+            v = self.W @ self._xx
+            deltas = r + gm_p*v[:, 1] - v[:, 0]
+            gl = gm*lm
+            if not isinstance(gl, float):
+                gl = gl.reshape(-1, 1)
+            self.Z *= gl
+            self.Z += self._xx[:, 0]
+            self.backend.multiply(self.Z, (alpha*deltas).reshape(-1, 1), out=self._scratch)
+            self.W += self._scratch
+        return deltas
+
+    def synchronize(self):
+        """Wait for all queued updates to finish."""
+        self.stream.synchronize()
+
+    def reset(self):
+        """Reset weights, traces, and other parameters."""
+        with self.stream:
+            self.W.fill(0)
+            self.Z.fill(0)
@@ -93,6 +93,9 @@ References
 """
 import numpy as np
 
+from _features import check_features
+from _td_kernels import dvtd_update
+
 
 class DVTD:
     """Direct-Variance Temporal Difference Learning or DVTD(λ).
@@ -101,6 +104,8 @@ class DVTD:
     ----------
     n : int
         The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
     z_val : Vector[float]
         The eligibility trace vector for the value estimator.
     w_val : Vector[float]
@@ -120,18 +125,21 @@ class DVTD:
     λ.
 
     """
-    def __init__(self, n):
+    def __init__(self, n, dtype=np.float32):
         """Initialize the learning algorithm.
 
         Parameters
         -----------
         n : int
             The number of features, i.e. expected length of the feature vector.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
         """
         self.n = n
-        self.w_val = np.zeros(self.n)
-        self.z_val = np.zeros(self.n)
-        self.w_var = np.zeros(self.n)
+        self.dtype = np.dtype(dtype)
+        self.w_val = np.zeros(self.n, dtype=self.dtype)
+        self.z_val = np.zeros(self.n, dtype=self.dtype)
+        self.w_var = np.zeros(self.n, dtype=self.dtype)
 
     def get_value(self, x):
         """Get the approximate value for feature vector `x`."""
@@ -174,22 +182,31 @@ class DVTD:
 
         Notes
         -----
-        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`.
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
         Other parameters are floats but are generally expected to be in the
         interval [0, 1].
         """
-        delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
-        self.z = x + gm*lm*self.z
-        self.w += alpha*delta*self.z
-
-        r_var = delta**2
-        γ_var = (gm_p*lm_p)**2
-        delta_var = r_var + γ_var*np.dot(self.w_var, xp) - np.dot(self.w_var, x)
-        self.w_var += alpha*delta_var*x
+        x = np.asarray(x, dtype=self.dtype)
+        xp = np.asarray(xp, dtype=self.dtype)
+        check_features(self.n, x, xp)
+
+        # Equivalent to the following, but computed in a single compiled kernel
+        # that updates both estimators in-place:
+        #   delta = r + gm_p*np.dot(self.w_val, xp) - np.dot(self.w_val, x)
+        #   self.z_val = x + gm*lm*self.z_val
+        #   self.w_val += alpha*delta*self.z_val
+        #
+        #   r_var = delta**2
+        #   γ_var = (gm_p*lm_p)**2
+        #   delta_var = r_var + γ_var*np.dot(self.w_var, xp) - np.dot(self.w_var, x)
+        #   self.w_var += alpha*delta_var*x
+        delta, delta_var = dvtd_update(self.w_val, self.z_val, self.w_var, x, xp,
+                                       r, alpha, gm, gm_p, lm, lm_p)
         return delta, delta_var
 
     def reset(self):
         """Reset weights, traces, and other parameters."""
-        self.z_val = np.zeros(self.n)
-        self.w_val = np.zeros(self.n)
-        self.w_var = np.zeros(self.n)
+        self.z_val.fill(0.0)
+        self.w_val.fill(0.0)
+        self.w_var.fill(0.0)
@@ -5,7 +5,11 @@ TODO: Test the implementation
 TODO: Add documentation
 TODO: Add citations
 """
+import warnings
+
 import numpy as np 
+from scipy.linalg import LinAlgWarning, solve
+from scipy.linalg.blas import dger
 
 
 class ELSTD:
@@ -27,7 +31,7 @@ class ELSTD:
     M : float
         The emphasis scalar.
     """
-    def __init__(self, num_features=None, epsilon=0):
+    def __init__(self, n, epsilon=0):
         """Initialize the learning algorithm.
 
         Parameters
@@ -39,21 +43,46 @@ class ELSTD:
             to initialize it with the identity matrix multiplied by `epsilon`.
         """
         self.n = n
+        self.z = np.zeros(self.n)
+        # `A` is kept in Fortran (column-major) order, as expected by BLAS
+        self.A = np.zeros((self.n, self.n), order='F')
+        self.b = np.zeros(self.n)
+        # scratch space for the updates, to avoid allocating every step
+        self._y = np.empty(self.n)
         self.reset(epsilon)
     
     def reset(self, epsilon=0):
         """Reset weights, traces, and other parameters."""
-        self.z = np.zeros(self.n)
-        self.A = np.eye(self.n) * epsilon
-        self.b = np.zeros(self.n)
+        self.z.fill(0.0)
+        self.A.fill(0.0)
+        np.fill_diagonal(self.A, epsilon)
+        self.b.fill(0.0)
+        self._theta = None
         self.F = 0
         self.M = 0
 
     @property
     def theta(self):
-        """Compute the weight vector via `A^{-1} b`."""
-        _theta = np.dot(np.linalg.pinv(self.A), self.b)
-        return _theta
+        """Compute the weight vector via `A^{-1} b`.
+
+        The solution is cached until the next call to `update` or `reset`;
+        each access returns a copy of it, so modifying the result does not
+        affect later reads.
+        """
+        if self._theta is None:
+            # Solving `A theta = b` directly is cheaper than forming `A^{-1}`,
+            # but only meaningful if `A` is well-conditioned, which it need not
+            # be (e.g. with `epsilon=0` and fewer samples than features).
+            # `solve` estimates the condition number of `A` as part of the
+            # factorization and warns if it is too large, in which case we fall
+            # back to the least-squares (pseudo-inverse) solution instead.
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', LinAlgWarning)
+                try:
+                    self._theta = solve(self.A, self.b)
+                except (LinAlgWarning, np.linalg.LinAlgError):
+                    self._theta = np.linalg.lstsq(self.A, self.b, rcond=None)[0]
+        return self._theta.copy()
 
     def update(self, x, reward, xp, gm, gm_p, lm, interest):
         """Update from new experience, i.e. from a transition `(x,r,xp)`.
@@ -77,7 +106,16 @@ class ELSTD:
             The 'interest' in the current state, from which emphasis is derived.
         """
         self.F = gm * self.F + interest
-        self.M = (lm * I) + ((1 - lm) * self.F)
-        self.z = (gm * lm * self.z + self.M * x)
-        self.A += np.outer(self.z, (x - gm_p*xp))
-        self.b += self.z * reward
\ No newline at end of file
+        self.M = (lm * interest) + ((1 - lm) * self.F)
+        # update the trace in-place, rather than allocating a new array
+        self.z *= gm * lm
+        np.multiply(x, self.M, out=self._y)
+        self.z += self._y
+        # `A += z (x - gm_p*xp)^T` as an in-place rank-1 update, which avoids
+        # materializing the outer product as a temporary `(n, n)` matrix
+        np.multiply(xp, -gm_p, out=self._y)
+        self._y += x
+        self.A = dger(1.0, self.z, self._y, a=self.A, overwrite_a=1)
+        np.multiply(self.z, reward, out=self._y)
+        self.b += self._y
+        self._theta = None
\ No newline at end of file
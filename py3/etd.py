@@ -3,6 +3,9 @@ Emphatic Temporal Difference Learning Algorithm (ETD), implemented in Python 3.
 """
 import numpy as np 
 
+from _features import check_features
+from _td_kernels import etd_update
+
 
 class ETD:
     """Emphatic Temporal Difference Learning, or ETD(λ).
@@ -11,6 +14,8 @@ class ETD:
     ----------
     n : int
         The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
     z : Vector[float]
         The eligibility trace vector.
     w : Vector[float]
@@ -20,17 +25,20 @@ class ETD:
     M : float
         The emphasis scalar.
     """
-    def __init__(self, n):
+    def __init__(self, n, dtype=np.float32):
         """Initialize the learning algorithm.
 
         Parameters
         -----------
         n : int
             The number of features
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
         """
         self.n = n
-        self.w = np.zeros(self.n)
-        self.z = np.zeros(self.n)
+        self.dtype = np.dtype(dtype)
+        self.w = np.zeros(self.n, dtype=self.dtype)
+        self.z = np.zeros(self.n, dtype=self.dtype)
         self.F = 0
         self.M = 0
 
@@ -72,15 +80,25 @@ class ETD:
 
         Notes
         -----
-        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`.
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
         Other parameters are floats but are generally expected to be in the 
         interval [0, 1].
         """
-        delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
+        x = np.asarray(x, dtype=self.dtype)
+        xp = np.asarray(xp, dtype=self.dtype)
+        check_features(self.n, x, xp)
+
         self.F = gm*self.F + interest
         self.M = lm*interest + (1 - lm)*self.F
-        self.z = rho*(x*self.M + gm*lm*self.z)
-        self.w += alpha*delta*self.z
+
+        # Equivalent to the following, but computed in a single compiled kernel
+        # that updates `self.z` and `self.w` in-place:
+        #   delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
+        #   self.z = rho*(x*self.M + gm*lm*self.z)
+        #   self.w += alpha*delta*self.z
+        delta = etd_update(self.w, self.z, x, xp, r, alpha, gm, gm_p, lm,
+                           rho, self.M)
 
         # prepare for next iteration
         self.F *= rho
@@ -90,5 +108,5 @@ class ETD:
         """Reset weights, traces, and other parameters."""
         self.F = 0
         self.M = 0
-        self.w = np.zeros(self.n)
-        self.z = np.zeros(self.n)
\ No newline at end of file
+        self.w.fill(0.0)
+        self.z.fill(0.0)
\ No newline at end of file
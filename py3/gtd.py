@@ -31,6 +31,9 @@ Where:
 """
 import numpy as np
 
+from _features import check_features
+from _td_kernels import gtd_update
+
 
 class GTD:
     """Gradient Temporal Difference Learning, or GTD(λ). Suitable for
@@ -40,6 +43,8 @@ class GTD:
     ----------
     n : int
         The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
     e : Vector[float]
         The eligibility trace vector.
     w : Vector[float]
@@ -51,18 +56,21 @@ class GTD:
     -----
     See page 74 and 91-92 of Maei's thesis for definition of the algorithm.
     """
-    def __init__(self, n):
+    def __init__(self, n, dtype=np.float32):
         """Initialize the learning algorithm.
 
         Parameters
         -----------
         n : int
             The number of features, i.e. expected length of the feature vector.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
         """
         self.n = n
-        self.e = np.zeros(self.n)
-        self.w = np.zeros(self.n)
-        self.h = np.zeros(self.n)
+        self.dtype = np.dtype(dtype)
+        self.e = np.zeros(self.n, dtype=self.dtype)
+        self.w = np.zeros(self.n, dtype=self.dtype)
+        self.h = np.zeros(self.n, dtype=self.dtype)
 
     def get_value(self, x):
         """Get the approximate value for feature vector `x`."""
@@ -104,18 +112,27 @@ class GTD:
 
         Notes
         -----
-        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`.
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
         Other parameters are floats but are generally expected to be in the
         interval [0, 1].
         """
-        delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
-        self.e = rho*(lm*gm*self.e + x)
-        self.w += alpha*(delta*self.e - gm_p*(1-lm_p)*np.dot(self.e, self.h)*xp)
-        self.h += beta*(delta*self.e - np.dot(self.h, x)*x)
+        x = np.asarray(x, dtype=self.dtype)
+        xp = np.asarray(xp, dtype=self.dtype)
+        check_features(self.n, x, xp)
+
+        # Equivalent to the following, but computed in a compiled kernel that
+        # updates `self.e`, `self.w`, and `self.h` in-place:
+        #   delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
+        #   self.e = rho*(lm*gm*self.e + x)
+        #   self.w += alpha*(delta*self.e - gm_p*(1-lm_p)*np.dot(self.e, self.h)*xp)
+        #   self.h += beta*(delta*self.e - np.dot(self.h, x)*x)
+        delta = gtd_update(self.w, self.e, self.h, x, xp, r, alpha, beta,
+                           gm, gm_p, lm, lm_p, rho)
         return delta
 
     def reset(self):
         """Reset weights, traces, and other parameters."""
-        self.e = np.zeros(self.n)
-        self.w = np.zeros(self.n)
-        self.h = np.zeros(self.n)
+        self.e.fill(0.0)
+        self.w.fill(0.0)
+        self.h.fill(0.0)
@@ -23,6 +23,9 @@ Where:
 """
 import numpy as np 
 
+from _features import check_features
+from _td_kernels import htd_update
+
 
 class HTD:
     """Hybrid Temporal Difference Learning, or HTD(λ).
@@ -33,6 +36,8 @@ class HTD:
     ----------
     n : int
         The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
     e : Vector[float]
         The importance sampling eligibility trace vector.
     z : Vector[float]
@@ -46,25 +51,28 @@ class HTD:
     -----
     See Adam White's PhD thesis, pg. 170-174 for a definition and discussion.
     """
-    def __init__(self, n):
+    def __init__(self, n, dtype=np.float32):
         """Initialize the learning algorithm.
 
         Parameters
         -----------
         n : int
             The number of features, i.e. expected length of the feature vector.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
         """
         self.n = n
-        self.e = np.zeros(self.n)
-        self.z = np.zeros(self.n)
-        self.w = np.zeros(self.n)
-        self.h = np.zeros(self.n)
+        self.dtype = np.dtype(dtype)
+        self.e = np.zeros(self.n, dtype=self.dtype)
+        self.z = np.zeros(self.n, dtype=self.dtype)
+        self.w = np.zeros(self.n, dtype=self.dtype)
+        self.h = np.zeros(self.n, dtype=self.dtype)
 
     def get_value(self, x):
         """Get the approximate value for feature vector `x`."""
         return np.dot(self.w, x)
 
-    def update(self, x, r, xp, alpha, beta, gm, gm_p, lm, rho:
+    def update(self, x, r, xp, alpha, beta, gm, gm_p, lm, rho):
         """Update from new experience, i.e. from a transition `(x,r,xp)`.
 
         
@@ -98,22 +106,30 @@ class HTD:
         
         Notes
         -----
-        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`.
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
         Other parameters are floats but are generally expected to be in the 
         interval [0, 1].
         """
-        delta = r + gm_p*np.dot(self.theta, xp) - np.dot(self.theta, x)
-        self.e = rho*(lm*gm*self.e + x)
-        self.z = lm*gm*self.z + x 
-        self.w += alpha*(delta*self.e + (gm_p*xp - x)*np.dot(self.z - self.e), self.h)
-        self.h += beta*(delta*self.e + (gm_p*xp - x)*np.dot(self.z, self.h)
-
+        x = np.asarray(x, dtype=self.dtype)
+        xp = np.asarray(xp, dtype=self.dtype)
+        check_features(self.n, x, xp)
+
+        # Equivalent to the following, but computed in a compiled kernel that
+        # updates the traces and weights in-place:
+        #   delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
+        #   self.e = rho*(lm*gm*self.e + x)
+        #   self.z = lm*gm*self.z + x
+        #   self.w += alpha*(delta*self.e + (gm_p*xp - x)*np.dot(self.z - self.e, self.h))
+        #   self.h += beta*(delta*self.e + (gm_p*xp - x)*np.dot(self.z, self.h))
+        delta = htd_update(self.w, self.e, self.z, self.h, x, xp, r, alpha, beta,
+                           gm, gm_p, lm, rho)
         return delta
 
     def reset(self):
         """Reset weights, traces, and other parameters."""
-        self.e = np.zeros(self.n)
-        self.z = np.zeros(self.n)
-        self.w = np.zeros(self.n)
-        self.h = np.zeros(self.n)
+        self.e.fill(0.0)
+        self.z.fill(0.0)
+        self.w.fill(0.0)
+        self.h.fill(0.0)
 
@@ -11,6 +11,10 @@ Richard Sutton
 Proceedings of Tenth National Conf. on Artificial Intelligence, pp. 171–176, 
 MIT Press, 1992.
 """
+import numpy as np
+
+from _features import check_features
+from _td_kernels import idbd_update
 
 class IDBD:
     """
@@ -19,7 +23,9 @@ class IDBD:
     Attributes
     ----------
     n : int 
-
+        The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and stepsizes.
     alpha : Vector[float]
         The vector of per-weight stepsizes.
     beta : Vector[float]
@@ -31,19 +37,35 @@ class IDBD:
     eta : float 
         Meta stepsize parameter.
     """
-    def __init__(self, n, eta=1):
+    def __init__(self, n, eta=1, dtype=np.float32):
         self.n = n 
         self.eta = eta
+        self.dtype = np.dtype(dtype)
+        self.beta = np.empty(self.n, dtype=self.dtype)
+        self.alpha = np.empty(self.n, dtype=self.dtype)
+        self.h = np.empty(self.n, dtype=self.dtype)
+        self.w = np.empty(self.n, dtype=self.dtype)
         self.reset()
 
     def reset(self):
         # What should beta be initialized to? Should `w` be zeros or random?
-        self.beta = (-1/self.n)*np.ones(self.n)
-        self.h = np.zeros(self.n)
-        self.w = np.zeros(self.n)
+        # (the arrays are filled in-place, rather than allocating new ones)
+        self.beta.fill(-1/self.n)
+        np.exp(self.beta, out=self.alpha)
+        self.h.fill(0.0)
+        self.w.fill(0.0)
 
     def update(self, x, delta):
-        self.beta += self.eta * self.h * delta * x
-        self.alpha = np.exp(self.beta)
-        self.w += self.alpha * delta * x 
-        self.h = self.h * np.max(0, 1 - self.alpha * x**2) + self.alpha*delta*x
\ No newline at end of file
+        """Update from the features `x` and the prediction error `delta`.
+
+        Equivalent to the following, but computed in a single compiled pass
+        that updates each of the vectors in-place:
+
+            self.beta += self.eta * self.h * delta * x
+            self.alpha = np.exp(self.beta)
+            self.w += self.alpha * delta * x
+            self.h = self.h * np.maximum(0, 1 - self.alpha * x**2) + self.alpha*delta*x
+        """
+        x = np.asarray(x, dtype=self.dtype)
+        check_features(self.n, x)
+        idbd_update(self.beta, self.alpha, self.w, self.h, x, delta, self.eta)
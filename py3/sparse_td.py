@@ -0,0 +1,144 @@
+"""
+TD(λ) with a sparse eligibility trace, for binary features such as those
+produced by tile coding.
+
+
+Summary
+-------
+
+With tile coding (or one-hot features) only `k` of the `n` features are active
+at each timestep, with `k` much smaller than `n`.
+`TD.update_sparse` takes advantage of this for the values and the trace
+increment, but its weight update still walks all `n` entries of the trace,
+since any of them may be nonzero.
+
+Here the trace is instead stored as a list of the features it is nonzero for
+(`z_idx`) along with their values (`z_val`).
+Since the trace decays geometrically (by γλ each step), the entries for
+features that have not been active for a while become negligible; any entry
+whose magnitude falls below a tolerance is dropped from the trace.
+With λγ < 1 the number of entries that remain is bounded, so each update costs
+time proportional to that (plus the number of active features) no matter how
+large `n` is.
+
+
+Update Equations
+----------------
+
+The update equations are those of TD(λ) (see `td.py`), except that any entry
+of the trace whose magnitude is less than the tolerance `tol` (after the
+weights have been updated) is set to zero.
+"""
+import numpy as np
+
+from _features import as_indices
+from _td_kernels import sparse_td_update
+
+
+class SparseTD:
+    """TD(λ) with accumulating traces stored sparsely, for binary features.
+
+    Attributes
+    ----------
+    n : int
+        The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
+    tol : float
+        Trace entries with a magnitude below this are dropped from the trace.
+    w : Vector[float]
+        The weight vector.
+    nnz : int
+        The number of entries currently in the trace.
+    z_idx : Vector[int]
+        The indices of the features in the trace, in the first `nnz` entries.
+    z_val : Vector[float]
+        The values of the trace for those features, in the first `nnz` entries.
+    """
+    def __init__(self, n, tol=1e-6, dtype=np.float32):
+        """Initialize the learning algorithm.
+
+        Parameters
+        -----------
+        n : int
+            The number of features, i.e. expected length of the feature vector.
+        tol : float, optional
+            The tolerance below which trace entries are dropped.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
+        """
+        self.n = n
+        self.tol = tol
+        self.dtype = np.dtype(dtype)
+        self.w = np.zeros(self.n, dtype=self.dtype)
+        # room for every feature, so that the trace can never overflow
+        self.nnz = 0
+        self.z_idx = np.zeros(self.n, dtype=np.intp)
+        self.z_val = np.zeros(self.n, dtype=self.dtype)
+        # position of each feature in `z_idx`, or -1 if it is not in the trace
+        self._pos = np.full(self.n, -1, dtype=np.intp)
+
+    @property
+    def z(self):
+        """The eligibility trace, as a dense vector."""
+        z = np.zeros(self.n, dtype=self.dtype)
+        z[self.z_idx[:self.nnz]] = self.z_val[:self.nnz]
+        return z
+
+    def get_value(self, idx):
+        """Get the approximate value for the features with indices `idx`."""
+        return np.sum(self.w[idx])
+
+    def update(self, idx, r, idx_p, alpha, gm, gm_p, lm):
+        """Update from a transition with binary features.
+
+        Parameters
+        ----------
+        idx : Vector[int]
+            The indices of the active features for the current timestep.
+        r : float
+            The reward from the transition.
+        idx_p : Vector[int]
+            The indices of the active features for the next timestep.
+        alpha : float
+            The step-size parameter for updating the weight vector.
+        gm : float
+            Gamma, abbreviated `gm`, the discount factor for the current state.
+        gm_p : float
+            The discount factor for the next state.
+        lm : float
+            Lambda, abbreviated `lm`, is the bootstrapping parameter for the
+            current timestep.
+
+        Returns
+        -------
+        delta : float
+            The temporal difference error from the update.
+
+        Notes
+        -----
+        As with `TD.update_sparse`, the features are given by the indices of
+        their nonzero (i.e., equal to one) entries, and an index that is
+        repeated counts as a feature with value equal to the number of times
+        it appears.
+        """
+        idx = as_indices(idx, self.n, 'idx')
+        idx_p = as_indices(idx_p, self.n, 'idx_p')
+
+        # Equivalent to the following, but only touching the entries of `z`
+        # that are in the trace or active:
+        #   delta = r + gm_p*np.sum(self.w[idx_p]) - np.sum(self.w[idx])
+        #   z = gm*lm*z + x
+        #   self.w += alpha*delta*z
+        #   z[np.abs(z) < self.tol] = 0
+        delta, self.nnz = sparse_td_update(self.w, self.z_idx, self.z_val,
+                                           self._pos, self.nnz, idx, idx_p, r,
+                                           alpha, gm, gm_p, lm, self.tol)
+        return delta
+
+    def reset(self):
+        """Reset weights, traces, and other parameters."""
+        self.w.fill(0.0)
+        self.z_val.fill(0.0)
+        self._pos.fill(-1)
+        self.nnz = 0
@@ -55,8 +55,26 @@ References
 
 0: https://webdocs.cs.ualberta.ca/~sutton/book/ebook/node75.html
 """
+import numba
 import numpy as np
 
+from _features import as_features, as_indices, check_features, check_trajectory
+from _td_kernels import (td_update, td0_update, td_update_parallel,
+                         td_update_sparse, td_trajectory, quantize,
+                         quantized_dot)
+
+# Optional compiled extension with kernels specialized for particular numbers of
+# features; see `cpp/td_kernel.cpp` for how to build it.
+try:
+    import td_kernel
+except ImportError:
+    td_kernel = None
+
+# Number of features above which `update` spreads its loops across threads
+# (when more than one is available); below this, the cost of starting the
+# threads outweighs the extra memory bandwidth.
+PARALLEL_MIN_FEATURES = 50000
+
 
 class TD:
     """Temporal Difference Learning or TD(λ) with accumulating traces.
@@ -70,27 +88,105 @@ class TD:
     ----------
     n : int
         The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
     z : Vector[float]
-        The eligibility trace vector.
+        The eligibility trace vector (up to the scale factor `z_scale`).
+    z_scale : float
+        The scale factor of the eligibility trace, which is `z_scale * z`.
+        This is only different from one after calls to `update_sparse`.
     w : Vector[float]
         The weight vector.
+    quantized : bool
+        Whether `get_value` uses an 8-bit quantized copy of the weights.
+    quantize_every : int
+        The number of updates between refreshes of the quantized weights.
     """
-    def __init__(self, n):
+    def __init__(self, n, dtype=np.float32, quantized=False, td0=False,
+                 specialized=False, quantize_every=1):
         """Initialize the learning algorithm.
 
         Parameters
         -----------
         n : int
             The number of features, i.e. expected length of the feature vector.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
+        quantized : bool, optional
+            If true, keep a copy of the weights quantized to 8-bit integers
+            and use it in `get_value`.
+            Since `x` is still read at full precision, this only cuts the
+            memory read per feature from 8 bytes to 5 (with single precision
+            features), so `get_value` is only slightly faster, and only for
+            very large `n` (a million features or so); for smaller `n` it is
+            slower.
+            In exchange the values lose some precision, and re-quantizing
+            costs two extra passes over the weights (see `quantize_every`).
+            Learning itself always uses the full precision weights.
+        td0 : bool, optional
+            If true, the learner will only be used with λ=0, i.e. as TD(0).
+            Then `update` ignores `gm` and `lm` and skips the trace entirely
+            (the trace for TD(0) is just the current features), which saves
+            a read and a write of `z` per step; `z` is left untouched.
+        specialized : bool, optional
+            If true, and the `td_kernel` extension (see `cpp/td_kernel.cpp`)
+            provides a kernel for `n` features, `update` uses it instead of
+            the Numba kernel.
+            The cost of converting its arguments means it is usually slower
+            than the default, so benchmark it before relying on it.
+        quantize_every : int, optional
+            If `quantized`, the quantized weights are refreshed after every
+            `quantize_every` updates rather than after each one, which spreads
+            the cost of re-quantizing over that many updates; in between,
+            `get_value` uses weights that are up to `quantize_every - 1`
+            updates out of date.
         """
         self.n = n
-        self.w = np.zeros(self.n)
-        self.z = np.zeros(self.n)
+        self.dtype = np.dtype(dtype)
+        self.w = np.zeros(self.n, dtype=self.dtype)
+        self.z = np.zeros(self.n, dtype=self.dtype)
+        self.z_scale = 1.0
+        # space for converting features to `self.dtype`, see `as_features`
+        self._features = np.empty((2, self.n), dtype=self.dtype)
+
+        # quantized weights such that `w ≈ _w_scale * _w_q`
+        self.quantized = quantized
+        self.quantize_every = quantize_every
+        self._w_q = np.zeros(self.n, dtype=np.int8)
+        self._w_scale = 0.0
+        # number of updates since the weights were last quantized
+        self._stale = 0
+
+        # use the multi-threaded kernel for very long feature vectors, and a
+        # kernel specialized for `n` features only if asked for
+        if self.n >= PARALLEL_MIN_FEATURES and numba.get_num_threads() > 1:
+            self._td_update = td_update_parallel
+        elif specialized:
+            self._td_update = getattr(td_kernel, 'td_update_%d' % self.n, td_update)
+        else:
+            self._td_update = td_update
+        if td0:
+            self.update = self._update_td0
 
     def get_value(self, x):
         """Get the approximate value for feature vector `x`."""
+        if self.quantized:
+            x = np.asarray(x, dtype=self.dtype)
+            check_features(self.n, x)
+            return quantized_dot(self._w_q, self._w_scale, x)
         return np.dot(self.w, x)
 
+    def get_values_batch(self, X):
+        """Get the approximate values for each row of the feature matrix `X`.
+
+        The values for all `T` rows of `X` (with shape `(T, n)`) are computed
+        with a single matrix-vector product, which is much faster than calling
+        `get_value` on each row in turn.
+        This always uses the full precision weights, even if `quantized`.
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        return np.dot(X, self.w)
+
     def update(self, x, r, xp, alpha, gm, gm_p, lm):
         """Update from new experience, i.e. from a transition `(x,r,xp)`.
 
@@ -119,16 +215,264 @@ class TD:
 
         Notes
         -----
-        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`.
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
         Other parameters are floats but are generally expected to be in the
         interval [0, 1].
         """
-        delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
-        self.z = x + gm*lm*self.z
-        self.w += alpha*delta*self.z
+        x, xp = as_features(x, xp, self._features)
+        self._unscale_trace()
+
+        # Equivalent to the following, but computed in a single compiled kernel
+        # that updates `self.z` and `self.w` in-place:
+        #   delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
+        #   self.z = x + gm*lm*self.z
+        #   self.w += alpha*delta*self.z
+        delta = self._td_update(self.w, self.z, x, xp, r, alpha, gm, gm_p, lm)
+        self._update_quantized()
+        return delta
+
+    def _update_td0(self, x, r, xp, alpha, gm, gm_p, lm):
+        """Update from a transition `(x,r,xp)` with λ=0, see `update`."""
+        x, xp = as_features(x, xp, self._features)
+
+        # Equivalent to the following, computed in a compiled kernel:
+        #   delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
+        #   self.w += alpha*delta*x
+        delta = td0_update(self.w, x, xp, r, alpha, gm_p)
+        self._update_quantized()
+        return delta
+
+    def update_trajectory(self, X, R, Xp, alpha, gm, gm_p, lm):
+        """Update from a sequence of transitions, in order.
+
+        This is equivalent to calling `update` on each transition in turn,
+        but the whole sequence is processed by a single compiled loop, which
+        avoids the overhead of calling `update` from Python at every timestep.
+
+        Parameters
+        ----------
+        X : Matrix[float]
+            The features from the current timestep of each transition, with
+            shape `(T, n)`.
+        R : Vector[float]
+            The reward from each transition, with shape `(T,)`.
+        Xp : Matrix[float]
+            The features from the next timestep of each transition, with
+            shape `(T, n)`.
+        alpha : float or Vector[float]
+            The step-size parameter for updating the weight vector.
+        gm : float or Vector[float]
+            Gamma, abbreviated `gm`, the discount factor for the current state.
+        gm_p : float or Vector[float]
+            The discount factor for the next state.
+        lm : float or Vector[float]
+            Lambda, abbreviated `lm`, is the bootstrapping parameter for the
+            current timestep.
+
+        Returns
+        -------
+        deltas : Vector[float]
+            The temporal difference error from each transition's update.
+
+        Notes
+        -----
+        The parameters `alpha`, `gm`, `gm_p`, and `lm` may either be floats,
+        in which case they are used for every transition, or arrays with one
+        entry per transition.
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        Xp = np.asarray(Xp, dtype=self.dtype)
+        R = np.asarray(R, dtype=np.float64)
+        check_trajectory(self.n, X, R, Xp)
+        T = len(R)
+        alpha, gm, gm_p, lm = (np.broadcast_to(np.asarray(v, dtype=np.float64), (T,))
+                               for v in (alpha, gm, gm_p, lm))
+        self._unscale_trace()
+        deltas = td_trajectory(self.w, self.z, X, R, Xp, alpha, gm, gm_p, lm)
+        self._update_quantized()
+        return deltas
+
+    def update_sparse(self, idx, r, idx_p, alpha, gm, gm_p, lm):
+        """Update from a transition with binary features, e.g. from tile coding.
+
+        Rather than full feature vectors, the features are given by the indices
+        of their nonzero (i.e., equal to one) entries, so that computing values
+        costs time proportional to the number of active features instead of
+        `n`.
+
+        Parameters
+        ----------
+        idx : Vector[int]
+            The indices of the active features for the current timestep.
+        r : float
+            The reward from the transition.
+        idx_p : Vector[int]
+            The indices of the active features for the next timestep.
+        alpha : float
+            The step-size parameter for updating the weight vector.
+        gm : float
+            Gamma, abbreviated `gm`, the discount factor for the current state.
+        gm_p : float
+            The discount factor for the next state.
+        lm : float
+            Lambda, abbreviated `lm`, is the bootstrapping parameter for the
+            current timestep.
+
+        Returns
+        -------
+        delta : float
+            The temporal difference error from the update.
+
+        Notes
+        -----
+        This performs the same update as `update(x, r, xp, ...)` where `x` is
+        zero everywhere except at `idx`, where it is one (and likewise for `xp`
+        and `idx_p`).
+        An index that is repeated counts as a feature with value equal to the
+        number of times it appears.
+
+        To avoid an extra pass over the trace, it is decayed lazily by
+        updating `self.z_scale` rather than scaling `self.z`; the scale is
+        folded back into `self.z` when it gets very small, or by the next call
+        to one of the dense update methods.
+        """
+        idx = as_indices(idx, self.n, 'idx')
+        idx_p = as_indices(idx_p, self.n, 'idx_p')
+        delta, self.z_scale = td_update_sparse(self.w, self.z, self.z_scale,
+                                               idx, idx_p, r, alpha, gm, gm_p, lm)
+        self._update_quantized()
         return delta
 
+    def _unscale_trace(self):
+        """Fold `z_scale` back into `z`, for updates that use `z` directly."""
+        if self.z_scale != 1.0:
+            self.z *= self.z_scale
+            self.z_scale = 1.0
+
+    def _update_quantized(self, force=False):
+        """Refresh the quantized copy of the weights, if it is being used and
+        `quantize_every` updates have passed (or `force` is true)."""
+        if not self.quantized:
+            return
+        self._stale += 1
+        if force or self._stale >= self.quantize_every:
+            self._w_scale = quantize(self.w, self._w_q)
+            self._stale = 0
+
+    def reset(self):
+        """Reset weights, traces, and other parameters."""
+        self.w.fill(0.0)
+        self.z.fill(0.0)
+        self.z_scale = 1.0
+        self._update_quantized(force=True)
+
+
+class TDGPU:
+    """TD(λ) with accumulating traces, stored and updated on a GPU.
+
+    This performs the same updates as `TD.update`, but keeps the weights and
+    trace in GPU memory and updates them with CuPy[1].
+    The two values are computed with one matrix-vector product, and the trace
+    and weights are updated by a single elementwise kernel, so each step reads
+    `w` twice and `z` once, at the (much higher) memory bandwidth of the GPU.
+    This pays off for very long feature vectors (e.g. `n` in the hundreds of
+    thousands or more); otherwise, the cost of launching the kernels and
+    copying the features to the device tends to dominate.
+
+    Attributes
+    ----------
+    n : int
+        The number of features (and therefore the length of the weight vector).
+    dtype : numpy.dtype
+        The floating point type of the weights and traces.
+    w : Vector[float]
+        The weight vector (a device array).
+    z : Vector[float]
+        The eligibility trace vector (a device array).
+    stream : cupy.cuda.Stream
+        The stream on which the updates are queued.
+
+    Notes
+    -----
+    As with `batch_td.BatchTDGPU`, `update` queues its work on `self.stream`
+    and returns without waiting for it to finish; use `synchronize()` to wait
+    for the queued updates.
+    Copying features from host memory to the device is only asynchronous when
+    they are in pinned memory; passing device arrays avoids the copy entirely.
+
+    References
+    ----------
+    1: https://cupy.dev/
+    """
+    def __init__(self, n, dtype=np.float32, backend=None):
+        """Initialize the learning algorithm.
+
+        Parameters
+        -----------
+        n : int
+            The number of features, i.e. expected length of the feature vector.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
+        backend : module, optional
+            The CuPy module (or a module with the same interface); imported on
+            demand if not provided.
+        """
+        if backend is None:
+            import cupy as backend
+        self.n = n
+        self.dtype = np.dtype(dtype)
+        self.backend = backend
+        self.w = backend.zeros(self.n, dtype=self.dtype)
+        self.z = backend.zeros(self.n, dtype=self.dtype)
+        # `x` and `xp` are copied into the columns of this matrix, so that both
+        # values are computed in a single pass over `w`
+        self._xx = backend.empty((self.n, 2), dtype=self.dtype, order='F')
+        self.stream = backend.cuda.Stream(non_blocking=True)
+        # `z = x + gm*lm*z` and `w += alpha*delta*z`, in one pass
+        self._trace_update = backend.ElementwiseKernel(
+            'T x, T gl, T az', 'T z, T w',
+            'z = x + gl*z; w += az*z;',
+            'td_trace_update')
+
+    def _to_device(self, v):
+        """Copy `v` to the device (if necessary) as an array of `self.dtype`."""
+        return self.backend.asarray(v, dtype=self.dtype)
+
+    def get_value(self, x):
+        """Get the approximate value for feature vector `x`."""
+        with self.stream:
+            return self.backend.dot(self.w, self._to_device(x))
+
+    def update(self, x, r, xp, alpha, gm, gm_p, lm):
+        """Update from new experience, i.e. from a transition `(x,r,xp)`.
+
+        The parameters are the same as for `TD.update`.
+
+        Returns
+        -------
+        delta : float
+            The temporal difference error from the update, as a 0-dimensional
+            device array; it is only valid once the update has finished.
+        """
+        with self.stream:
+            self._xx[:, 0] = self._to_device(x)
+            self._xx[:, 1] = self._to_device(xp)
+            v = self.w @ self._xx
+            delta = r + gm_p*v[1] - v[0]
+            # the TD-error stays on the device, so there is no need to wait
+            # for the values before queueing the rest of the update
+            az = (alpha*delta).astype(self.dtype)
+            self._trace_update(self._xx[:, 0], self.dtype.type(gm*lm), az,
+                               self.z, self.w)
+        return delta
+
+    def synchronize(self):
+        """Wait for all queued updates to finish."""
+        self.stream.synchronize()
+
     def reset(self):
         """Reset weights, traces, and other parameters."""
-        self.w = np.zeros(self.n)
-        self.z = np.zeros(self.n)
+        with self.stream:
+            self.w.fill(0)
+            self.z.fill(0)
@@ -0,0 +1,215 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+Cython versions of TD(λ) and true-online TD(λ), as `cdef` classes.
+
+
+Summary
+-------
+
+These perform the same updates as `td.TD` and `totd.TOTD`, but the weights and
+traces are stored in typed memoryviews, and `update` is a `cpdef` method whose
+loops are compiled to C.
+Calling `update` therefore costs a single method call with no conversion of
+its arguments, which is useful when it is called from other Cython code (where
+it is a direct C call) or when `n` is small enough that the per-call overhead
+of the other implementations dominates.
+
+To keep the methods lean, the features must already be contiguous single
+precision arrays (e.g. `np.asarray(x, dtype=np.float32)`); anything else
+raises a `ValueError`.
+As in `_td_kernels.py`, the inner products are accumulated in double precision.
+
+Each class exposes `w` and `z` (and `w_old`, for `TOTD`) as NumPy arrays that
+share memory with the memoryviews, so they can be inspected or modified as
+with the pure Python classes.
+
+
+Building
+--------
+
+This module is optional, and has to be compiled before it can be imported.
+With Cython installed, from the root of the repository:
+
+    CFLAGS="-O3 -march=native -ffast-math" cythonize -i -3 py3/td_cy.pyx
+
+which produces `py3/td_cy*.so` alongside the Python modules.
+"""
+import numpy as np
+
+
+cdef class TD:
+    """Temporal Difference Learning or TD(λ) with accumulating traces.
+
+    See `td.TD` for a description of the algorithm; this version only supports
+    dense feature vectors of single precision values.
+
+    Attributes
+    ----------
+    n : int
+        The number of features (and therefore the length of the weight vector).
+    w : Vector[float]
+        The weight vector.
+    z : Vector[float]
+        The eligibility trace vector.
+    """
+    cdef readonly int n
+    cdef readonly object w
+    cdef readonly object z
+    cdef float[::1] _w
+    cdef float[::1] _z
+
+    def __init__(self, int n):
+        """Initialize the learning algorithm.
+
+        Parameters
+        -----------
+        n : int
+            The number of features, i.e. expected length of the feature vector.
+        """
+        self.n = n
+        self.w = np.zeros(self.n, dtype=np.float32)
+        self.z = np.zeros(self.n, dtype=np.float32)
+        self._w = self.w
+        self._z = self.z
+
+    cpdef double get_value(self, const float[::1] x):
+        """Get the approximate value for feature vector `x`."""
+        cdef double v = 0
+        cdef int i
+        if x.shape[0] != self.n:
+            raise ValueError("features must have length %d" % self.n)
+        for i in range(self.n):
+            v += self._w[i]*x[i]
+        return v
+
+    cpdef double update(self, const float[::1] x, double r, const float[::1] xp,
+                        double alpha, double gm, double gm_p, double lm):
+        """Update from new experience, i.e. from a transition `(x,r,xp)`.
+
+        See `td.TD.update` for a description of the parameters; `x` and `xp`
+        must be contiguous single precision arrays of length `self.n`.
+        """
+        cdef float[::1] w = self._w
+        cdef float[::1] z = self._z
+        cdef float g = gm_p
+        cdef double dot_d = 0
+        cdef double delta
+        cdef float gl, az
+        cdef int i
+        if x.shape[0] != self.n or xp.shape[0] != self.n:
+            raise ValueError("features must have length %d" % self.n)
+
+        # `delta = r + gm_p*w^T xp - w^T x`, as a single inner product
+        for i in range(self.n):
+            dot_d += w[i]*(g*xp[i] - x[i])
+        delta = r + dot_d
+
+        gl = gm*lm
+        az = alpha*delta
+        for i in range(self.n):
+            z[i] = x[i] + gl*z[i]
+            w[i] += az*z[i]
+        return delta
+
+    def reset(self):
+        """Reset weights, traces, and other parameters."""
+        self.w.fill(0.0)
+        self.z.fill(0.0)
+
+
+cdef class TOTD:
+    """True-online temporal difference learning with linear function approximation.
+
+    See `totd.TOTD` for a description of the algorithm; this version only
+    supports dense feature vectors of single precision values.
+
+    Attributes
+    ----------
+    n : int
+        The number of features (and therefore the length of the weight vector).
+    w : Vector[float]
+        The current weight vector.
+    w_old : Vector[float]
+        The weights from before the most recent update.
+    z : Vector[float]
+        The array of the eligibility traces.
+    """
+    cdef readonly int n
+    cdef readonly object w
+    cdef readonly object w_old
+    cdef readonly object z
+    cdef float[::1] _w
+    cdef float[::1] _w_old
+    cdef float[::1] _z
+
+    def __init__(self, int n):
+        """Initialize the learning algorithm.
+
+        Parameters
+        -----------
+        n : int
+            The number of features, i.e. expected length of the feature vector.
+        """
+        self.n = n
+        self.w = np.zeros(self.n, dtype=np.float32)
+        self.w_old = np.zeros(self.n, dtype=np.float32)
+        self.z = np.zeros(self.n, dtype=np.float32)
+        self._w = self.w
+        self._w_old = self.w_old
+        self._z = self.z
+
+    cpdef double get_value(self, const float[::1] x):
+        """Get the approximate value for feature vector `x`."""
+        cdef double v = 0
+        cdef int i
+        if x.shape[0] != self.n:
+            raise ValueError("features must have length %d" % self.n)
+        for i in range(self.n):
+            v += self._w[i]*x[i]
+        return v
+
+    cpdef double update(self, const float[::1] x, double r, const float[::1] xp,
+                        double alpha, double gm, double gm_p, double lm):
+        """Update from new experience, i.e. from a transition `(x,r,xp)`.
+
+        See `totd.TOTD.update` for a description of the parameters; `x` and
+        `xp` must be contiguous single precision arrays of length `self.n`.
+        """
+        cdef float[::1] w = self._w
+        cdef float[::1] w_old = self._w_old
+        cdef float[::1] z = self._z
+        cdef double dot_x = 0
+        cdef double dot_xp = 0
+        cdef double dot_old_x = 0
+        cdef double dot_zx = 0
+        cdef double delta
+        cdef float gl, zc, wc, d
+        cdef int i
+        if x.shape[0] != self.n or xp.shape[0] != self.n:
+            raise ValueError("features must have length %d" % self.n)
+
+        for i in range(self.n):
+            dot_x += w[i]*x[i]
+            dot_xp += w[i]*xp[i]
+            dot_old_x += w_old[i]*x[i]
+            dot_zx += z[i]*x[i]
+        # the TD-error bootstraps from the previous weights' value of `x`
+        delta = r + gm_p*dot_xp - dot_old_x
+
+        # `z = gm*lm*z + alpha*x - alpha*gm*lm*(z^T x)*x`
+        # `w += delta*z + alpha*(w_old^T x - w^T x)*x`
+        gl = gm*lm
+        zc = alpha*(1 - gm*lm*dot_zx)
+        wc = alpha*(dot_old_x - dot_x)
+        d = delta
+        for i in range(self.n):
+            z[i] = gl*z[i] + zc*x[i]
+            w_old[i] = w[i]
+            w[i] += d*z[i] + wc*x[i]
+        return delta
+
+    def reset(self):
+        """Reset weights, traces, and other parameters."""
+        self.w.fill(0.0)
+        self.w_old.fill(0.0)
+        self.z.fill(0.0)
@@ -9,6 +9,10 @@ ICML. Vol. 14. 2014.](http://www.jmlr.org/proceedings/papers/v32/seijen14.pdf)
 TODO: Test the implementation
 TODO: Add documentation
 """
+import numpy as np
+
+from _features import as_features, check_trajectory
+from _td_kernels import totd_update, totd_trajectory
 
 
 class TOTD:
@@ -17,32 +21,48 @@ class TOTD:
     TODO: Test this code
     TODO: Consider modifying the update function to remove alpha from the trace. 
     """
-    def __init__(self, n):
+    def __init__(self, n, dtype=np.float32):
         """Initialize the learning algorithm.
 
         Parameters
         -----------
         n : int
             The number of features, i.e. expected length of the feature vector.
+        dtype : data-type, optional
+            The floating point type of the weights and traces.
         
         Attributes
         ----------
         w : Vector[float]
             The current weight vector.
         w_old : Vector[float]
-            The previous time-step's weight vector.
+            The previous time-step's weight vector, i.e. the weights from
+            before the most recent update.
         z : Vector[float]
             The array of the eligibility traces.
         """
         self.n      = n
-        self.w      = np.zeros(self.n)
-        self.w_old  = np.zeros(self.n)
-        self.z      = np.zeros(self.n)
+        self.dtype  = np.dtype(dtype)
+        self.w      = np.zeros(self.n, dtype=self.dtype)
+        self.w_old  = np.zeros(self.n, dtype=self.dtype)
+        self.z      = np.zeros(self.n, dtype=self.dtype)
+        # space for converting features to `self.dtype`, see `as_features`
+        self._features = np.empty((2, self.n), dtype=self.dtype)
 
     def get_value(self, x):
         """Get the approximate value for feature vector `x`."""
         return np.dot(self.w, x)
 
+    def get_values_batch(self, X):
+        """Get the approximate values for each row of the feature matrix `X`.
+
+        The values for all `T` rows of `X` (with shape `(T, n)`) are computed
+        with a single matrix-vector product, which is much faster than calling
+        `get_value` on each row in turn.
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        return np.dot(X, self.w)
+
     def update(self, x, r, xp, alpha, gm, gm_p, lm):
         """Update from new experience, i.e. from a transition `(x,r,xp)`.
 
@@ -72,17 +92,74 @@ class TOTD:
 
         Notes
         -----
-        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`.
+        Features (`x` and `xp`) are assumed to be 1D arrays of length `self.n`,
+        and are converted to `self.dtype` if they are not already of that type.
         Other parameters are floats but are generally expected to be in the
         interval [0, 1].
         """
-        delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w, x)
-        self.z = gm*lm*self.z + alpha*x - alpha*gm*lm*np.dot(self.z, x)*x
-        self.w += delta*self.z + alpha*(np.dot(self.w_old, x) - np.dot(self.w, x))*x
+        x, xp = as_features(x, xp, self._features)
+
+        # Equivalent to the following, but computed in a single compiled kernel
+        # that updates `self.z`, `self.w`, and `self.w_old` in-place:
+        #   delta = r + gm_p*np.dot(self.w, xp) - np.dot(self.w_old, x)
+        #   self.z = gm*lm*self.z + alpha*x - alpha*gm*lm*np.dot(self.z, x)*x
+        #   w = self.w.copy()
+        #   self.w += delta*self.z + alpha*(np.dot(self.w_old, x) - np.dot(self.w, x))*x
+        #   self.w_old = w
+        delta = totd_update(self.w, self.w_old, self.z, x, xp, r, alpha, gm, gm_p, lm)
         return delta
 
+    def update_trajectory(self, X, R, Xp, alpha, gm, gm_p, lm):
+        """Update from a sequence of transitions, in order.
+
+        This is equivalent to calling `update` on each transition in turn,
+        but the whole sequence is processed by a single compiled loop, which
+        avoids the overhead of calling `update` from Python at every timestep.
+
+        Parameters
+        ----------
+        X : Matrix[float]
+            The features from the current timestep of each transition, with
+            shape `(T, n)`.
+        R : Vector[float]
+            The reward from each transition, with shape `(T,)`.
+        Xp : Matrix[float]
+            The features from the next timestep of each transition, with
+            shape `(T, n)`.
+        alpha : float or Vector[float]
+            The step-size parameter for updating the weight vector.
+        gm : float or Vector[float]
+            Gamma, abbreviated `gm`, the discount factor for the current state.
+        gm_p : float or Vector[float]
+            The discount factor for the next state.
+        lm : float or Vector[float]
+            Lambda, abbreviated `lm`, is the bootstrapping parameter for the
+            current timestep.
+
+        Returns
+        -------
+        deltas : Vector[float]
+            The temporal difference error from each transition's update.
+
+        Notes
+        -----
+        The parameters `alpha`, `gm`, `gm_p`, and `lm` may either be floats,
+        in which case they are used for every transition, or arrays with one
+        entry per transition.
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        Xp = np.asarray(Xp, dtype=self.dtype)
+        R = np.asarray(R, dtype=np.float64)
+        check_trajectory(self.n, X, R, Xp)
+        T = len(R)
+        alpha, gm, gm_p, lm = (np.broadcast_to(np.asarray(v, dtype=np.float64), (T,))
+                               for v in (alpha, gm, gm_p, lm))
+        deltas = totd_trajectory(self.w, self.w_old, self.z, X, R, Xp,
+                                 alpha, gm, gm_p, lm)
+        return deltas
+
     def reset(self):
         """Reset weights, traces, and other parameters."""
-        self.w      = np.zeros(self.n)
-        self.w_old  = np.zeros(self.n)
-        self.z      = np.zeros(self.n)
\ No newline at end of file
+        self.w.fill(0.0)
+        self.w_old.fill(0.0)
+        self.z.fill(0.0)
\ No newline at end of file